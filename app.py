@@ -3,7 +3,8 @@ Flask Backend API для парсинга отзывов Booking.com
 """
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from scrapers.booking_reviews import parse_booking_reviews
+from scrapers.booking_reviews import parse_booking_reviews_with_status
+from scrapers.watchlist import WatchList
 import logging
 import os
 from dotenv import load_dotenv
@@ -21,6 +22,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Watch list отелей с фоновым обновлением (общий для всех воркеров через SQLite)
+watchlist = WatchList(
+    db_path=os.getenv('WATCHLIST_DB', 'watchlist.sqlite3'),
+    concurrency=int(os.getenv('WATCHLIST_CONCURRENCY', 2)),
+    min_interval=float(os.getenv('WATCHLIST_MIN_INTERVAL', 5))
+)
+# Планировщик запустится только в одном из воркеров
+watchlist.start()
+
 
 @app.route('/api/parse-reviews', methods=['POST'])
 def parse_reviews():
@@ -31,15 +41,22 @@ def parse_reviews():
     Request body:
     {
         "booking_url": "https://www.booking.com/hotel/...",
-        "hotel_id": "hotel-1"  // опционально
+        "hotel_id": "hotel-1",  // опционально
+        "deadline_ms": 8000     // опционально, бюджет времени на парсинг
     }
     
     Response:
     {
         "status": "success",
         "reviews_found": 10,
-        "reviews": [...]
+        "reviews": [...],
+        "partial": false,  // true если парсинг прерван по дедлайну
+        "stage": null      // этап, прерванный по дедлайну
     }
+    
+    Для отелей из watch list сразу возвращается последний удачный результат
+    с полями "cached": true, "stale" и "age_seconds"; устаревший результат
+    ставится в очередь на фоновое обновление.
     """
     try:
         data = request.get_json()
@@ -49,6 +66,7 @@ def parse_reviews():
         
         booking_url = data.get('booking_url')
         hotel_id = data.get('hotel_id', 'unknown')
+        deadline_ms = data.get('deadline_ms')
         
         if not booking_url:
             return jsonify({"error": "booking_url is required"}), 400
@@ -57,15 +75,42 @@ def parse_reviews():
         if not booking_url.startswith('https://www.booking.com'):
             return jsonify({"error": "Invalid booking.com URL"}), 400
         
-        logger.info(f"Parsing reviews for hotel_id: {hotel_id}, URL: {booking_url}")
+        if deadline_ms is not None and (isinstance(deadline_ms, bool) or not isinstance(deadline_ms, int) or deadline_ms <= 0):
+            return jsonify({"error": "deadline_ms must be a positive integer"}), 400
+        
+        # Отель из watch list: отдаем последний удачный результат без ожидания парсинга
+        entry = watchlist.get(booking_url)
+        if entry is not None and entry.reviews is not None:
+            stale = entry.is_stale()
+            if stale:
+                watchlist.request_refresh(booking_url)
+            return jsonify({
+                "status": "success",
+                "reviews_found": len(entry.reviews),
+                "reviews": entry.reviews,
+                "partial": False,
+                "stage": None,
+                "cached": True,
+                "stale": stale,
+                "age_seconds": round(entry.age(), 1)
+            })
+        
+        logger.info(f"Parsing reviews for hotel_id: {hotel_id}, URL: {booking_url}, deadline_ms: {deadline_ms}")
         
         # Парсинг отзывов
-        reviews = parse_booking_reviews(booking_url, max_reviews=10)
+        result = parse_booking_reviews_with_status(booking_url, max_reviews=10, deadline_ms=deadline_ms)
+        reviews = result["reviews"]
+        
+        # Отель в watch list, но еще без результата: сохраняем результат живого парсинга
+        if entry is not None and not result["partial"]:
+            watchlist.store_result(booking_url, reviews)
         
         return jsonify({
             "status": "success",
             "reviews_found": len(reviews),
-            "reviews": reviews
+            "reviews": reviews,
+            "partial": result["partial"],
+            "stage": result["stage"]
         })
         
     except Exception as e:
@@ -73,6 +118,78 @@ def parse_reviews():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/watchlist', methods=['GET'])
+def list_watchlist():
+    """
+    GET /api/watchlist
+    Список отелей из watch list с возрастом и устареванием результатов
+    """
+    return jsonify({"status": "success", "entries": watchlist.entries()}), 200
+
+
+@app.route('/api/watchlist', methods=['POST'])
+def register_watchlist():
+    """
+    POST /api/watchlist
+    Добавляет отель в watch list для фонового обновления отзывов
+    
+    Request body:
+    {
+        "booking_url": "https://www.booking.com/hotel/...",
+        "hotel_id": "hotel-1",       // опционально
+        "max_age_seconds": 3600      // желаемая свежесть результата
+    }
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "Request body is required"}), 400
+        
+        booking_url = data.get('booking_url')
+        hotel_id = data.get('hotel_id', 'unknown')
+        max_age = data.get('max_age_seconds', 3600)
+        
+        if not booking_url:
+            return jsonify({"error": "booking_url is required"}), 400
+        
+        if not booking_url.startswith('https://www.booking.com'):
+            return jsonify({"error": "Invalid booking.com URL"}), 400
+        
+        if isinstance(max_age, bool) or not isinstance(max_age, (int, float)) or max_age <= 0:
+            return jsonify({"error": "max_age_seconds must be a positive number"}), 400
+        
+        entry = watchlist.register(booking_url, hotel_id, max_age)
+        return jsonify({"status": "success", "entry": entry.to_dict()}), 201
+        
+    except Exception as e:
+        logger.error(f"Error in register_watchlist endpoint: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/watchlist', methods=['DELETE'])
+def unregister_watchlist():
+    """
+    DELETE /api/watchlist
+    Удаляет отель из watch list
+    
+    Request body:
+    {
+        "booking_url": "https://www.booking.com/hotel/..."
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    booking_url = data.get('booking_url')
+    
+    if not booking_url:
+        return jsonify({"error": "booking_url is required"}), 400
+    
+    if not watchlist.unregister(booking_url):
+        return jsonify({"error": "Hotel is not in watch list"}), 404
+    
+    return jsonify({"status": "success"}), 200
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -87,6 +204,9 @@ def index():
         "version": "1.0.0",
         "endpoints": {
             "POST /api/parse-reviews": "Parse reviews from Booking.com",
+            "GET /api/watchlist": "List watched hotels and their staleness",
+            "POST /api/watchlist": "Watch a hotel and refresh its reviews in background",
+            "DELETE /api/watchlist": "Stop watching a hotel",
             "GET /health": "Health check"
         }
     }), 200
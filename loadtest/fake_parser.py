@@ -0,0 +1,102 @@
+"""
+Заглушка parse_booking_reviews для нагрузочного тестирования
+Имитирует задержку, ошибки и потребление памяти парсера без запуска браузера.
+Параметры читаются из переменных окружения (их выставляет loadtest/run.py).
+"""
+import os
+import random
+import time
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_latency_spec(spec: str):
+    """
+    Разбирает описание распределения задержки (в миллисекундах)
+
+    Форматы:
+        fixed:500
+        uniform:200,2000
+        normal:1000,300
+        lognormal:1000,0.5   (медиана, sigma)
+        exp:1000             (среднее)
+    """
+    kind, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',') if value]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'normal' and len(values) == 2:
+        return lambda: max(random.gauss(values[0], values[1]), 0)
+    if kind == 'lognormal' and len(values) == 2:
+        return lambda: values[0] * random.lognormvariate(0, values[1])
+    if kind == 'exp' and len(values) == 1:
+        return lambda: random.expovariate(1.0 / values[0])
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+class FakeParser:
+    """Заглушка парсера с настраиваемыми задержкой, ошибками и памятью"""
+
+    def __init__(self, latency: str = 'lognormal:1000,0.5', failure_rate: float = 0.0,
+                 failure_mode: str = 'exception', memory_mb: float = 0.0, reviews: int = 10):
+        self.sample_latency = _parse_latency_spec(latency)
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self.memory_mb = memory_mb
+        self.reviews = reviews
+
+    @classmethod
+    def from_env(cls) -> 'FakeParser':
+        """Создает заглушку по переменным окружения LOADTEST_*"""
+        return cls(
+            latency=os.getenv('LOADTEST_LATENCY', 'lognormal:1000,0.5'),
+            failure_rate=float(os.getenv('LOADTEST_FAILURE_RATE', 0)),
+            failure_mode=os.getenv('LOADTEST_FAILURE_MODE', 'exception'),
+            memory_mb=float(os.getenv('LOADTEST_MEMORY_MB', 0)),
+            reviews=int(os.getenv('LOADTEST_REVIEWS', 10)),
+        )
+
+    def __call__(self, booking_url: str, max_reviews: int = 10, deadline_ms: Optional[int] = None) -> Dict:
+        """Повторяет сигнатуру и формат результата parse_booking_reviews_with_status"""
+        started = time.monotonic()
+        latency_ms = self.sample_latency()
+        partial = deadline_ms is not None and latency_ms > deadline_ms
+        if partial:
+            latency_ms = deadline_ms
+
+        # Удерживаем память на время "парсинга", как это делает браузер
+        ballast = bytearray(int(self.memory_mb * 1024 * 1024))
+        for offset in range(0, len(ballast), 4096):
+            ballast[offset] = 1
+        time.sleep(latency_ms / 1000.0)
+        del ballast
+
+        if random.random() < self.failure_rate:
+            if self.failure_mode == 'empty':
+                return {"reviews": [], "partial": False, "stage": None}
+            raise Exception("Simulated parser failure")
+
+        service_ms = (time.monotonic() - started) * 1000
+        reviews = [
+            {
+                "text": f"Simulated review {idx + 1} for {booking_url}",
+                "rating": 9.0,
+                "author": "Load Test",
+                "country": "",
+                "date": "",
+                "room_type": "",
+                "stay_duration": "",
+                # Время работы заглушки: клиент вычитает его из задержки, чтобы оценить очередь
+                "service_ms": round(service_ms, 1),
+            }
+            for idx in range(min(self.reviews, max_reviews))
+        ]
+        return {
+            "reviews": reviews,
+            "partial": partial,
+            "stage": "extraction" if partial else None,
+        }
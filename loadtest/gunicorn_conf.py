@@ -0,0 +1,20 @@
+"""
+Конфигурация gunicorn для нагрузочного тестирования
+Подменяет парсер в app.py и в планировщике watch list на FakeParser
+после загрузки приложения в воркере
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def post_worker_init(worker):
+    """Подключает заглушку парсера к загруженному app.py"""
+    import app
+    from loadtest.fake_parser import FakeParser
+
+    fake_parser = FakeParser.from_env()
+    app.parse_booking_reviews_with_status = fake_parser
+    # Планировщик watch list запускается при импорте app.py и не должен запускать Chrome
+    app.watchlist.parser = lambda booking_url, max_reviews=10: fake_parser(booking_url, max_reviews)["reviews"]
+    logger.info(f"Worker {worker.pid}: parser replaced with FakeParser")
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Нагрузочное тестирование Flask/gunicorn сервиса
+Запускает настоящий app.py под gunicorn с заглушкой парсера (FakeParser)
+и нагружает POST /api/parse-reviews параллельными запросами.
+
+Пример:
+    python -m loadtest.run --workers 2 4 --worker-class sync gthread --threads 1 4 \\
+        --concurrency 10 --requests 200 --latency lognormal:3000,0.6 --failure-rate 0.05
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOOKING_URL = 'https://www.booking.com/hotel/ae/load-test.html'
+
+_local = threading.local()
+
+
+def _free_port() -> int:
+    """Свободный локальный порт для gunicorn"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values: List[float], percent: float):
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100.0 * len(ordered)) - 1, 0)
+    return round(ordered[rank], 1)
+
+
+def _effective_worker_class(worker_class: str, threads: int) -> str:
+    """Класс воркера, который реально запустит gunicorn: sync с threads > 1 заменяется на gthread"""
+    if worker_class == 'sync' and threads > 1:
+        return 'gthread'
+    return worker_class
+
+
+def _start_server(args, workers: int, worker_class: str, threads: int, port: int, data_dir: str):
+    """Запускает gunicorn с app.py и заглушкой парсера (watch list - во временной базе в data_dir)"""
+    env = dict(os.environ)
+    env.update({
+        'WATCHLIST_DB': os.path.join(data_dir, 'watchlist.sqlite3'),
+        'LOADTEST_LATENCY': args.latency,
+        'LOADTEST_FAILURE_RATE': str(args.failure_rate),
+        'LOADTEST_FAILURE_MODE': args.failure_mode,
+        'LOADTEST_MEMORY_MB': str(args.memory_mb),
+        'PYTHONPATH': ROOT_DIR + os.pathsep + env.get('PYTHONPATH', ''),
+    })
+    cmd = [
+        sys.executable, '-m', 'gunicorn',
+        'app:app',
+        '--config', os.path.join(ROOT_DIR, 'loadtest', 'gunicorn_conf.py'),
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers),
+        '--worker-class', worker_class,
+        '--threads', str(threads),
+        '--timeout', str(args.timeout),
+        '--log-level', 'warning',
+    ]
+    if worker_class == 'gthread':
+        # По умолчанию gthread воркер принимает до 1000 соединений и держит их в очереди
+        # к своим потокам, даже когда свободны другие воркеры
+        cmd += ['--worker-connections', str(args.worker_connections or threads)]
+    output = None if args.server_logs else subprocess.DEVNULL
+    process = subprocess.Popen(cmd, cwd=ROOT_DIR, env=env, stdout=output, stderr=output)
+
+    base_url = f'http://127.0.0.1:{port}'
+    started = time.monotonic()
+    while time.monotonic() - started < args.startup_timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            if requests.get(f'{base_url}/health', timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    _stop_server(process)
+    raise RuntimeError("gunicorn did not become healthy in time")
+
+
+def _stop_server(process):
+    """Останавливает gunicorn"""
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def _send_request(base_url: str, args) -> Dict:
+    """
+    Один запрос к /api/parse-reviews
+
+    По умолчанию каждый запрос идет по новому соединению: keep-alive соединение
+    остается у воркера, который его принял, и запросы клиента не распределяются
+    между воркерами. С --keep-alive каждый клиент держит свое соединение.
+    """
+    if args.keep_alive:
+        session = getattr(_local, 'session', None)
+        if session is None:
+            session = _local.session = requests.Session()
+        headers = {}
+    else:
+        session = requests
+        headers = {'Connection': 'close'}
+
+    payload = {"booking_url": BOOKING_URL, "hotel_id": "load-test"}
+    if args.deadline_ms:
+        payload["deadline_ms"] = args.deadline_ms
+
+    started = time.monotonic()
+    result = {"status": None, "outcome": "ok", "service_ms": None, "partial": False}
+    try:
+        response = session.post(f'{base_url}/api/parse-reviews', json=payload, headers=headers,
+                                timeout=args.client_timeout)
+        result["status"] = response.status_code
+        if response.status_code == 200:
+            data = response.json()
+            result["partial"] = data.get("partial", False)
+            if data.get("reviews"):
+                result["service_ms"] = data["reviews"][0].get("service_ms")
+        elif not response.headers.get('Content-Type', '').startswith('application/json') \
+                and time.monotonic() - started >= args.timeout * 0.9:
+            # gunicorn отвечает HTML-страницей 500, когда убивает воркер по --timeout
+            result["outcome"] = "timeout"
+        else:
+            result["outcome"] = "error"
+    except requests.Timeout:
+        result["outcome"] = "timeout"
+    except requests.RequestException:
+        # Воркер, убитый по --timeout, обрывает соединение
+        elapsed = time.monotonic() - started
+        result["outcome"] = "timeout" if elapsed >= args.timeout * 0.9 else "error"
+    result["latency_ms"] = (time.monotonic() - started) * 1000
+    return result
+
+
+def _run_scenario(args, workers: int, worker_class: str, threads: int, concurrency: int) -> Dict:
+    """Один прогон нагрузки для заданной конфигурации"""
+    with tempfile.TemporaryDirectory(prefix='loadtest-') as data_dir:
+        process, base_url = _start_server(args, workers, worker_class, threads, _free_port(), data_dir)
+        try:
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(lambda _: _send_request(base_url, args), range(args.requests)))
+            elapsed = time.monotonic() - started
+        finally:
+            _stop_server(process)
+
+    latencies = [result["latency_ms"] for result in results]
+    queueing = [
+        result["latency_ms"] - result["service_ms"]
+        for result in results if result["service_ms"] is not None
+    ]
+    total = len(results)
+    ok = sum(1 for result in results if result["outcome"] == "ok")
+    return {
+        "workers": workers,
+        "worker_class": worker_class,
+        "threads": threads,
+        "concurrency": concurrency,
+        "requests": total,
+        "duration_s": round(elapsed, 2),
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else None,
+        "latency_p50_ms": _percentile(latencies, 50),
+        "latency_p95_ms": _percentile(latencies, 95),
+        "latency_p99_ms": _percentile(latencies, 99),
+        "queue_p50_ms": _percentile(queueing, 50),
+        "queue_p95_ms": _percentile(queueing, 95),
+        "error_rate": round(sum(1 for result in results if result["outcome"] == "error") / total, 4),
+        "timeout_rate": round(sum(1 for result in results if result["outcome"] == "timeout") / total, 4),
+        "partial_rate": round(sum(1 for result in results if result["partial"]) / total, 4),
+    }
+
+
+def _print_report(reports: List[Dict]):
+    """Печатает сводную таблицу по всем прогонам"""
+    columns = [
+        ("workers", "workers"), ("worker_class", "class"), ("threads", "thr"), ("concurrency", "conc"),
+        ("throughput_rps", "rps"), ("latency_p50_ms", "p50 ms"), ("latency_p95_ms", "p95 ms"),
+        ("latency_p99_ms", "p99 ms"), ("queue_p50_ms", "queue p50"), ("queue_p95_ms", "queue p95"),
+        ("error_rate", "errors"), ("timeout_rate", "timeouts"),
+    ]
+    widths = [
+        max(len(title), *(len(str(report[key])) for report in reports))
+        for key, title in columns
+    ]
+    print("  ".join(title.rjust(width) for (_, title), width in zip(columns, widths)))
+    for report in reports:
+        print("  ".join(str(report[key]).rjust(width) for (key, _), width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test app.py under gunicorn with a fake parser backend")
+    parser.add_argument('--workers', type=int, nargs='+', default=[2], help="gunicorn worker counts to compare")
+    parser.add_argument('--worker-class', nargs='+', default=['sync'], help="gunicorn worker classes to compare")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1],
+                        help="threads per worker to compare (sync runs only with 1 thread)")
+    parser.add_argument('--timeout', type=int, default=120, help="gunicorn worker timeout, seconds")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10], help="concurrent clients to compare")
+    parser.add_argument('--requests', type=int, default=200, help="requests per scenario")
+    parser.add_argument('--client-timeout', type=float, default=130, help="client request timeout, seconds")
+    parser.add_argument('--deadline-ms', type=int, default=None, help="deadline_ms sent with each request")
+    parser.add_argument('--latency', default='lognormal:1000,0.5',
+                        help="fake parser latency in ms: fixed:X, uniform:A,B, normal:M,SD, lognormal:MEDIAN,SIGMA, exp:MEAN")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="share of fake parser failures")
+    parser.add_argument('--failure-mode', choices=['exception', 'empty'], default='exception',
+                        help="exception -> HTTP 500, empty -> no reviews")
+    parser.add_argument('--memory-mb', type=float, default=0.0, help="memory held by fake parser per request")
+    parser.add_argument('--startup-timeout', type=float, default=30, help="seconds to wait for gunicorn health")
+    parser.add_argument('--worker-connections', type=int, default=0,
+                        help="gthread: connections accepted per worker (0 - as many as threads)")
+    parser.add_argument('--keep-alive', action='store_true',
+                        help="reuse one connection per client (connections stay pinned to one worker)")
+    parser.add_argument('--server-logs', action='store_true', help="show gunicorn and app.py logs")
+    parser.add_argument('--json', action='store_true', help="print reports as JSON")
+    args = parser.parse_args()
+
+    reports = []
+    for workers, worker_class, threads, concurrency in itertools.product(
+            args.workers, args.worker_class, args.threads, args.concurrency):
+        effective_class = _effective_worker_class(worker_class, threads)
+        if effective_class != worker_class:
+            # gunicorn молча запустил бы gthread, и строка "sync" повторила бы gthread
+            print(f"Skipping: worker_class={worker_class} with threads={threads} runs as {effective_class}",
+                  file=sys.stderr)
+            continue
+        print(f"Running: workers={workers}, worker_class={worker_class}, threads={threads}, "
+              f"concurrency={concurrency}, requests={args.requests}...", file=sys.stderr)
+        reports.append(_run_scenario(args, workers, worker_class, threads, concurrency))
+
+    if not reports:
+        parser.exit(1, "No scenarios to run: sync workers run only with --threads 1\n")
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        _print_report(reports)
+
+
+if __name__ == '__main__':
+    main()
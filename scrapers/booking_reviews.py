@@ -15,8 +15,13 @@ import platform
 import time
 import re
 import json
+import hashlib
 import logging
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Optional
+from selenium.common.exceptions import TimeoutException
+from scrapers.deadline import Deadline, StageBudget
+from scrapers.review_discovery import extract_reviews, graphql_operation_name
 
 logger = logging.getLogger(__name__)
 
@@ -76,8 +81,51 @@ def _setup_driver():
             raise
 
 
-def _close_cookie_banner(driver):
+def _quit_abandoned_driver(future):
+    """Закрывает драйвер, запуск которого не уложился в дедлайн"""
+    try:
+        driver = future.result()
+        driver.quit()
+        logger.info("Abandoned driver closed")
+    except Exception as e:
+        logger.debug(f"Abandoned driver setup failed: {e}")
+
+
+def _lease_driver(budget: StageBudget):
+    """Запускает WebDriver в пределах бюджета этапа (None если не уложились)"""
+    if budget.remaining() is None:
+        return _setup_driver()
+    
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(_setup_driver)
+    executor.shutdown(wait=False)
+    try:
+        return future.result(timeout=budget.remaining())
+    except FutureTimeoutError:
+        budget.mark_cut()
+        future.add_done_callback(_quit_abandoned_driver)
+        return None
+
+
+def _load_page(driver, url, budget: StageBudget):
+    """Открывает страницу, ограничивая загрузку бюджетом этапа"""
+    remaining = budget.remaining()
+    if remaining is not None:
+        driver.set_page_load_timeout(max(remaining, 0.1))
+    try:
+        driver.get(url)
+    except TimeoutException:
+        # Останавливаем загрузку и работаем с тем, что уже есть в DOM
+        budget.mark_cut()
+        try:
+            driver.execute_script("window.stop();")
+        except Exception as e:
+            logger.debug(f"Could not stop page loading: {e}")
+
+
+def _close_cookie_banner(driver, budget: Optional[StageBudget] = None):
     """Закрывает cookie баннер если он есть"""
+    budget = budget or StageBudget('navigation')
     try:
         cookie_selectors = [
             "button[id*='onetrust']",
@@ -90,11 +138,13 @@ def _close_cookie_banner(driver):
             "button:contains('Принять')"
         ]
         for selector in cookie_selectors:
+            if budget.expired():
+                break
             try:
                 cookie_btn = driver.find_element(By.CSS_SELECTOR, selector)
                 if cookie_btn.is_displayed():
                     driver.execute_script("arguments[0].click();", cookie_btn)
-                    time.sleep(1)
+                    budget.pad(1)
                     logger.info("Cookie banner closed")
                     break
             except:
@@ -103,13 +153,14 @@ def _close_cookie_banner(driver):
         logger.debug(f"Cookie banner not found or error: {e}")
 
 
-def _navigate_to_reviews(driver, booking_url):
+def _navigate_to_reviews(driver, booking_url, budget: Optional[StageBudget] = None):
     """Навигация к разделу отзывов"""
+    budget = budget or StageBudget('navigation')
     try:
         # Попытка перейти напрямую на вкладку отзывов
         reviews_url = booking_url.split('#')[0] + '#tab-reviews'
-        driver.get(reviews_url)
-        time.sleep(3)
+        _load_page(driver, reviews_url, budget)
+        budget.pad(3)
         logger.info("Navigated to reviews tab")
     except Exception as e:
         logger.warning(f"Could not navigate to reviews tab directly: {e}")
@@ -124,11 +175,13 @@ def _navigate_to_reviews(driver, booking_url):
             "a:contains('Отзывы')"
         ]
         for selector in reviews_selectors:
+            if budget.expired():
+                break
             try:
                 reviews_link = driver.find_element(By.CSS_SELECTOR, selector)
                 driver.execute_script("arguments[0].scrollIntoView(true);", reviews_link)
                 driver.execute_script("arguments[0].click();", reviews_link)
-                time.sleep(3)
+                budget.pad(3)
                 logger.info("Clicked on reviews link")
                 break
             except:
@@ -137,6 +190,110 @@ def _navigate_to_reviews(driver, booking_url):
         logger.debug(f"Could not click reviews link: {e}")
 
 
+# Схлопывает вложенные кандидаты за один проход в браузере.
+# Отзывом считается кандидат с текстом и автором или датой внутри: одна оценка
+# (виджет общего рейтинга, бейдж) или название отеля отзывом не считаются.
+# Кандидат, внутри которого два и более отзыва, считается оберткой и раскрывается;
+# кандидат, почти весь текст которого занимает единственный вложенный отзыв, заменяется им.
+# Вложенные части отзыва без автора и даты (например, строки "понравилось"/"не понравилось")
+# остаются внутри своего отзыва.
+_RESOLVE_CANDIDATES_SCRIPT = """
+var FIELD_SELECTOR = "[class*='author'],[class*='reviewer'],[class*='avatar'],[class*='guest'],"
+    + "[data-testid*='author'],[data-testid*='avatar'],[class*='date'],[data-testid*='date'],time";
+var nodes = [];
+var seen = new Set();
+for (var i = 0; i < arguments[0].length; i++) {
+    var node = arguments[0][i];
+    if (!seen.has(node)) { seen.add(node); nodes.push(node); }
+}
+nodes.sort(function(a, b) {
+    if (a === b) return 0;
+    return a.compareDocumentPosition(b) & Node.DOCUMENT_POSITION_FOLLOWING ? -1 : 1;
+});
+var parents = [];
+var stack = [];
+for (var i = 0; i < nodes.length; i++) {
+    while (stack.length && !nodes[stack[stack.length - 1]].contains(nodes[i])) stack.pop();
+    parents.push(stack.length ? stack[stack.length - 1] : -1);
+    stack.push(i);
+}
+var textLength = nodes.map(function(node) {
+    return (node.innerText || node.textContent || '').trim().length;
+});
+var isReview = nodes.map(function(node, i) {
+    return textLength[i] > 10 && node.querySelector(FIELD_SELECTOR) !== null;
+});
+if (isReview.indexOf(true) < 0) return null;
+// Ближайшие вложенные отзывы и число всех вложенных отзывов каждого кандидата
+// (дети идут в документе после родителя)
+var reviewKids = nodes.map(function() { return []; });
+var nestedReviews = nodes.map(function() { return 0; });
+for (var i = nodes.length - 1; i >= 0; i--) {
+    var parent = parents[i];
+    if (parent < 0) continue;
+    var kids = isReview[i] ? [i] : reviewKids[i];
+    reviewKids[parent] = kids.concat(reviewKids[parent]);
+    nestedReviews[parent] += nestedReviews[i] + (isReview[i] ? 1 : 0);
+}
+var result = [];
+function select(i) {
+    var kids = reviewKids[i];
+    if (isReview[i]) {
+        var isList = nestedReviews[i] > 1;
+        var wrapsSingle = kids.length === 1 && textLength[kids[0]] >= 0.9 * textLength[i];
+        if (!isList && !wrapsSingle) {
+            result.push(nodes[i]);
+            return;
+        }
+    }
+    kids.forEach(select);
+}
+for (var i = 0; i < nodes.length; i++) {
+    if (parents[i] < 0) select(i);
+}
+return result;
+"""
+
+
+def _resolve_review_candidates(driver, elements):
+    """Схлопывает вложенные и пересекающиеся кандидаты до внешних контейнеров отзывов"""
+    if len(elements) < 2:
+        return elements
+    try:
+        resolved = driver.execute_script(_RESOLVE_CANDIDATES_SCRIPT, elements)
+        if resolved:
+            if len(resolved) != len(elements):
+                logger.info(f"Resolved {len(elements)} candidate elements to {len(resolved)} review containers")
+            return resolved
+    except Exception as e:
+        logger.debug(f"Could not resolve review candidates: {e}")
+    return elements
+
+
+def _review_fingerprint(review):
+    """Хеш нормализованного содержимого отзыва"""
+    parts = [
+        re.sub(r'\s+', ' ', str(review.get(key) or '')).strip().lower()
+        for key in ("text", "author", "date")
+    ]
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _dedupe_reviews(reviews):
+    """Удаляет повторяющиеся отзывы, сохраняя порядок"""
+    seen = set()
+    unique = []
+    for review in reviews:
+        fingerprint = _review_fingerprint(review)
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        unique.append(review)
+    if len(unique) != len(reviews):
+        logger.info(f"Removed {len(reviews) - len(unique)} duplicate reviews")
+    return unique
+
+
 def _find_review_elements(driver):
     """Находит элементы отзывов используя различные селекторы"""
     review_selectors = [
@@ -161,23 +318,26 @@ def _find_review_elements(driver):
             elements = driver.find_elements(By.CSS_SELECTOR, selector)
             if len(elements) > 0:
                 logger.info(f"Found {len(elements)} reviews using selector: {selector}")
-                return elements
+                return _resolve_review_candidates(driver, elements)
         except:
             continue
     
     return []
 
-def _scroll_to_load_reviews(driver, max_reviews):
+def _scroll_to_load_reviews(driver, max_reviews, budget: Optional[StageBudget] = None):
     """Прокрутка страницы для загрузки отзывов (lazy loading)"""
+    budget = budget or StageBudget('scrolling')
     for i in range(8):  # Увеличили количество попыток
+        if budget.expired():
+            break
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2)
+        budget.pad(2)
         
         # Проверка, сколько отзывов загружено
         reviews = _find_review_elements(driver)
         if len(reviews) >= max_reviews:
             logger.info(f"Loaded {len(reviews)} reviews")
-            break
+            return
         
         # Дополнительная прокрутка к элементу отзывов
         try:
@@ -192,12 +352,16 @@ def _scroll_to_load_reviews(driver, max_reviews):
                 try:
                     review_section = driver.find_element(By.CSS_SELECTOR, selector)
                     driver.execute_script("arguments[0].scrollIntoView(true);", review_section)
-                    time.sleep(2)
+                    budget.pad(2)
                     break
                 except:
                     continue
         except:
             pass
+    
+    # Загружено меньше max_reviews, а прокрутка была сокращена дедлайном
+    if budget.expired() or budget.trimmed:
+        budget.mark_cut()
 
 
 def _extract_review_data(review_element):
@@ -411,7 +575,7 @@ def _intercept_graphql_requests(driver, booking_url, max_reviews):
                             data = json.loads(response_body['body'])
                             # Извлекаем отзывы из ответа
                             # Структура зависит от конкретного API
-                            reviews.extend(_extract_reviews_from_graphql_response(data))
+                            reviews.extend(_extract_reviews_from_graphql_response(data, url))
                             if len(reviews) >= max_reviews:
                                 break
                     except:
@@ -423,50 +587,60 @@ def _intercept_graphql_requests(driver, booking_url, max_reviews):
     
     return reviews
 
-def _extract_reviews_from_graphql_response(data):
-    """Извлекает отзывы из GraphQL ответа"""
-    reviews = []
+def _extract_reviews_from_graphql_response(data, url=None, operation=None):
+    """Извлекает отзывы из GraphQL ответа (путь к отзывам определяется автоматически и кешируется по url и операции)"""
     try:
-        # Пытаемся найти отзывы в различных структурах ответа
-        if isinstance(data, dict):
-            # Различные возможные пути к данным
-            paths = [
-                ['data', 'hotel', 'reviews'],
-                ['data', 'reviews'],
-                ['reviews'],
-                ['data', 'getHotelReviews', 'reviews'],
-            ]
-            
-            for path in paths:
-                current = data
-                try:
-                    for key in path:
-                        current = current[key]
-                    if isinstance(current, list):
-                        reviews = current
-                        break
-                except (KeyError, TypeError):
-                    continue
+        return extract_reviews(data, url, operation)
     except Exception as e:
         logger.debug(f"Error extracting reviews from GraphQL response: {e}")
-    
-    return reviews
+        return []
 
-def parse_booking_reviews(booking_url: str, max_reviews: int = 10) -> List[Dict]:
+def _build_result(reviews, deadline: Deadline) -> Dict:
+    """Формирует результат парсинга с признаком частичного ответа"""
+    return {
+        "reviews": reviews,
+        "partial": deadline.partial,
+        "stage": deadline.cut_stage,
+    }
+
+def parse_booking_reviews(booking_url: str, max_reviews: int = 10, deadline_ms: Optional[int] = None) -> List[Dict]:
     """
     Парсит отзывы из Booking.com
     
     Args:
         booking_url: URL страницы отеля на Booking.com
         max_reviews: Максимальное количество отзывов (по умолчанию 10)
+        deadline_ms: Бюджет времени на весь парсинг в миллисекундах (опционально)
     
     Returns:
         Список словарей с данными отзывов
     """
+    return parse_booking_reviews_with_status(booking_url, max_reviews, deadline_ms)["reviews"]
+
+def parse_booking_reviews_with_status(booking_url: str, max_reviews: int = 10, deadline_ms: Optional[int] = None) -> Dict:
+    """
+    Парсит отзывы из Booking.com с учетом дедлайна
+    
+    Бюджет deadline_ms распределяется между этапами (driver, navigation, scrolling,
+    network, extraction). Если этап не уложился в свою долю, он прерывается,
+    а парсинг продолжается с тем, что уже загружено.
+    
+    Args:
+        booking_url: URL страницы отеля на Booking.com
+        max_reviews: Максимальное количество отзывов (по умолчанию 10)
+        deadline_ms: Бюджет времени на весь парсинг в миллисекундах (опционально)
+    
+    Returns:
+        {"reviews": [...], "partial": bool, "stage": имя первого прерванного этапа или None}
+    """
+    deadline = Deadline(deadline_ms)
     driver = None
     try:
         logger.info(f"Starting to parse reviews from: {booking_url}")
-        driver = _setup_driver()
+        driver = _lease_driver(deadline.stage('driver'))
+        if driver is None:
+            logger.warning("Driver was not ready before deadline")
+            return _build_result([], deadline)
         
         # Включаем Network logging для перехвата GraphQL запросов
         try:
@@ -475,31 +649,38 @@ def parse_booking_reviews(booking_url: str, max_reviews: int = 10) -> List[Dict]
         except Exception as e:
             logger.debug(f"Could not enable Network logging: {e}")
         
-        driver.get(booking_url)
-        time.sleep(5)  # Увеличили время ожидания
+        navigation_budget = deadline.stage('navigation')
+        _load_page(driver, booking_url, navigation_budget)
+        navigation_budget.pad(5)  # Увеличили время ожидания
         
         # Закрыть cookie баннер
-        _close_cookie_banner(driver)
-        time.sleep(2)
+        _close_cookie_banner(driver, navigation_budget)
+        navigation_budget.pad(2)
         
         # Перейти к отзывам
-        _navigate_to_reviews(driver, booking_url)
+        _navigate_to_reviews(driver, booking_url, navigation_budget)
         
         # Дополнительное ожидание после навигации
-        time.sleep(3)
+        navigation_budget.pad(3)
         
         # Прокрутить для загрузки (это может инициировать GraphQL запросы)
-        _scroll_to_load_reviews(driver, max_reviews)
-        time.sleep(2)  # Дополнительное ожидание для завершения GraphQL запросов
+        _scroll_to_load_reviews(driver, max_reviews, deadline.stage('scrolling'))
+        
+        network_budget = deadline.stage('network')
+        network_budget.pad(2)  # Дополнительное ожидание для завершения GraphQL запросов
         
         # Пытаемся перехватить GraphQL запросы с детальным логированием
         reviews_from_graphql = []
         all_network_requests = []
+        request_operations = {}  # requestId -> имя GraphQL операции
         try:
             logs = driver.get_log('performance')
             logger.info(f"Total performance logs: {len(logs)}")
             
             for log in logs:
+                if network_budget.expired():
+                    network_budget.mark_cut()
+                    break
                 try:
                     message = json.loads(log['message'])['message']
                     method = message.get('method', '')
@@ -509,6 +690,15 @@ def parse_booking_reviews(booking_url: str, max_reviews: int = 10) -> List[Dict]
                         request_data = message['params'].get('request', {})
                         url = request_data.get('url', '')
                         method_type = request_data.get('method', '')
+                        if 'graphql' in url.lower():
+                            post_data = request_data.get('postData')
+                            if post_data is None and request_data.get('hasPostData'):
+                                # Большие тела запросов не попадают в лог, запрашиваем отдельно
+                                try:
+                                    post_data = driver.execute_cdp_cmd('Network.getRequestPostData', {'requestId': message['params'].get('requestId')}).get('postData')
+                                except Exception as e:
+                                    logger.debug(f"Could not read request post data for {url}: {e}")
+                            request_operations[message['params'].get('requestId')] = graphql_operation_name(post_data)
                         # Логируем только потенциально интересные запросы
                         if any(keyword in url.lower() for keyword in ['api', 'graphql', 'review', 'hotel', 'data', 'json']):
                             logger.info(f"[NETWORK REQUEST] {method_type} {url}")
@@ -554,7 +744,8 @@ def parse_booking_reviews(booking_url: str, max_reviews: int = 10) -> List[Dict]
                                             # Ищем отзывы
                                             if 'review' in body.lower() or 'rating' in body.lower():
                                                 logger.info(f"[REVIEWS DETECTED] Found 'review' or 'rating' in response body")
-                                                extracted = _extract_reviews_from_graphql_response(data)
+                                                operation = request_operations.get(request_id)
+                                                extracted = _extract_reviews_from_graphql_response(data, url, operation)
                                                 if extracted:
                                                     reviews_from_graphql.extend(extracted)
                                                     logger.info(f"[SUCCESS] Found {len(extracted)} reviews in response from {url}")
@@ -577,45 +768,46 @@ def parse_booking_reviews(booking_url: str, max_reviews: int = 10) -> List[Dict]
         except Exception as e:
             logger.error(f"GraphQL interception failed: {e}", exc_info=True)
         
-        # Если нашли отзывы через GraphQL, преобразуем их в нужный формат и возвращаем
+        # Если нашли отзывы через GraphQL, возвращаем их (поля уже приведены к нужному формату)
         if len(reviews_from_graphql) > 0:
-            formatted_reviews = []
-            for review in reviews_from_graphql[:max_reviews]:
-                if isinstance(review, dict):
-                    formatted_reviews.append({
-                        "text": review.get("text", review.get("comment", review.get("message", ""))),
-                        "rating": review.get("rating", review.get("score")),
-                        "author": review.get("author", review.get("guest_name", review.get("name", ""))),
-                        "country": review.get("country", review.get("guest_country", "")),
-                        "date": review.get("date", review.get("created_at", review.get("review_date", ""))),
-                        "room_type": review.get("room_type", review.get("room", "")),
-                        "stay_duration": review.get("stay_duration", review.get("nights", "")),
-                    })
+            formatted_reviews = _dedupe_reviews(reviews_from_graphql)[:max_reviews]
             logger.info(f"Successfully parsed {len(formatted_reviews)} reviews via GraphQL/API")
-            return formatted_reviews
+            return _build_result(formatted_reviews, deadline)
         
         # Fallback: используем DOM парсинг
+        extraction_budget = deadline.stage('extraction')
         # Найти все отзывы используя различные селекторы
         review_elements = _find_review_elements(driver)
         logger.info(f"Found {len(review_elements)} review elements via DOM")
         
         # Если отзывы не найдены, попробуем найти любые элементы с текстом отзывов
-        if len(review_elements) == 0:
+        if len(review_elements) == 0 and extraction_budget.expired():
+            extraction_budget.mark_cut()
+        elif len(review_elements) == 0:
             logger.warning("No reviews found with standard selectors, trying alternative approach...")
             try:
                 # Попробуем найти элементы по классам, содержащим "review"
                 all_review_candidates = driver.find_elements(By.XPATH, "//div[contains(@class, 'review') or contains(@class, 'Review')]")
                 logger.info(f"Found {len(all_review_candidates)} candidate elements with 'review' in class")
                 if len(all_review_candidates) > 0:
-                    review_elements = all_review_candidates[:max_reviews * 3]  # Берем больше кандидатов
+                    review_elements = _resolve_review_candidates(driver, all_review_candidates)[:max_reviews * 3]  # Берем больше кандидатов
             except Exception as e:
                 logger.debug(f"Alternative search failed: {e}")
         
         reviews = []
+        seen_fingerprints = set()
         for idx, elem in enumerate(review_elements[:max_reviews * 2]):  # Берем больше, чтобы отфильтровать пустые
+            if extraction_budget.expired():
+                extraction_budget.mark_cut()
+                break
             try:
                 review_data = _extract_review_data(elem)
                 if review_data.get("text") and len(review_data.get("text", "")) > 10:  # Только если есть текст
+                    fingerprint = _review_fingerprint(review_data)
+                    if fingerprint in seen_fingerprints:
+                        logger.debug(f"Skipping duplicate review {idx}")
+                        continue
+                    seen_fingerprints.add(fingerprint)
                     reviews.append(review_data)
                     if len(reviews) >= max_reviews:
                         break
@@ -624,11 +816,13 @@ def parse_booking_reviews(booking_url: str, max_reviews: int = 10) -> List[Dict]
                 continue
         
         logger.info(f"Successfully parsed {len(reviews)} reviews")
-        return reviews[:max_reviews]
+        if deadline.partial:
+            logger.warning(f"Returning partial result, stage cut short: {deadline.cut_stage}")
+        return _build_result(reviews[:max_reviews], deadline)
         
     except Exception as e:
         logger.error(f"Error parsing Booking.com reviews: {e}", exc_info=True)
-        return []
+        return _build_result([], deadline)
     finally:
         if driver:
             driver.quit()
@@ -0,0 +1,115 @@
+"""
+Дедлайны запросов парсинга
+Общий бюджет времени делится между этапами парсинга: каждый этап получает
+свою долю от оставшегося времени, чтобы последующие этапы не остались без бюджета
+"""
+import time
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Этапы parse_booking_reviews и их веса при распределении бюджета
+STAGE_WEIGHTS = (
+    ('driver', 2),
+    ('navigation', 3),
+    ('scrolling', 2),
+    ('network', 1),
+    ('extraction', 2),
+)
+
+# Этапы, без которых остальная работа невозможна: они могут занять весь
+# оставшийся бюджет, кроме доли, оставляемой последующим этапам
+BLOCKING_STAGES = ('driver',)
+RESERVE_SHARE = 0.3
+
+
+class StageBudget:
+    """Бюджет времени одного этапа"""
+
+    # Доля оставшегося бюджета, которую может занять одно ожидание
+    PAD_SHARE = 0.5
+
+    def __init__(self, name: str, seconds: Optional[float] = None, deadline: Optional['Deadline'] = None):
+        self.name = name
+        self.cut = False
+        self.trimmed = False
+        self._deadline = deadline
+        self._expires_at = None if seconds is None else time.monotonic() + max(seconds, 0)
+
+    def remaining(self) -> Optional[float]:
+        """Оставшееся время этапа в секундах (None - без ограничений)"""
+        if self._expires_at is None:
+            return None
+        return max(self._expires_at - time.monotonic(), 0)
+
+    def mark_cut(self):
+        """Помечает этап как прерванный: часть работы этапа не выполнена из-за дедлайна"""
+        if not self.cut:
+            self.cut = True
+            logger.warning(f"Stage '{self.name}' cut short by deadline")
+            if self._deadline is not None:
+                self._deadline.mark_cut(self.name)
+
+    def expired(self) -> bool:
+        """Проверяет, исчерпан ли бюджет этапа"""
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def pad(self, seconds: float):
+        """
+        Ожидание загрузки страницы в пределах бюджета этапа
+
+        Ожидание занимает не больше PAD_SHARE от оставшегося бюджета, чтобы этапу
+        хватило времени на основную работу. Сокращенное ожидание не считается
+        прерыванием этапа, но отмечается в trimmed.
+        """
+        remaining = self.remaining()
+        if remaining is not None and seconds > remaining * self.PAD_SHARE:
+            seconds = remaining * self.PAD_SHARE
+            self.trimmed = True
+        time.sleep(seconds)
+
+
+class Deadline:
+    """Общий дедлайн запроса с распределением бюджета по этапам"""
+
+    def __init__(self, deadline_ms: Optional[int] = None, stages=STAGE_WEIGHTS):
+        self._expires_at = None if deadline_ms is None else time.monotonic() + deadline_ms / 1000.0
+        self._pending = dict(stages)
+        self.cut_stage = None
+
+    @property
+    def partial(self) -> bool:
+        """True если хотя бы один этап был прерван по дедлайну"""
+        return self.cut_stage is not None
+
+    def remaining(self) -> Optional[float]:
+        """Оставшееся время запроса в секундах (None - без ограничений)"""
+        if self._expires_at is None:
+            return None
+        return max(self._expires_at - time.monotonic(), 0)
+
+    def mark_cut(self, stage: str):
+        """Запоминает первый этап, прерванный по дедлайну"""
+        if self.cut_stage is None:
+            self.cut_stage = stage
+
+    def stage(self, name: str) -> StageBudget:
+        """
+        Начинает этап и выделяет ему долю оставшегося бюджета
+
+        Доля пропорциональна весу этапа среди этапов, которые еще не начаты.
+        Блокирующие этапы (BLOCKING_STAGES) получают весь остаток, кроме
+        RESERVE_SHARE для последующих этапов.
+        """
+        weight = self._pending.pop(name, 1)
+        remaining = self.remaining()
+        if remaining is None:
+            return StageBudget(name, deadline=self)
+        total = weight + sum(self._pending.values())
+        seconds = remaining * weight / total
+        if name in BLOCKING_STAGES and self._pending:
+            seconds = max(seconds, remaining * (1 - RESERVE_SHARE))
+        logger.info(f"Stage '{name}' budget: {seconds:.2f}s of {remaining:.2f}s remaining")
+        return StageBudget(name, seconds, deadline=self)
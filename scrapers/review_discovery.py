@@ -0,0 +1,288 @@
+"""
+Поиск отзывов в перехваченных JSON ответах
+Рекурсивно ищет массивы объектов, похожих на отзывы (text, rating, author, date...),
+и автоматически сопоставляет их поля. Найденный путь кешируется для каждого endpoint
+и GraphQL операции, чтобы следующие ответы разбирались прямым обращением по пути,
+без обхода дерева.
+"""
+import json
+import re
+import threading
+import logging
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Ключи, по которым распознаются поля отзыва: (точные имена, подстроки)
+FIELD_KEYS = {
+    "text": (
+        ("text", "comment", "message", "reviewtext", "body", "content", "positivetext", "positive"),
+        ("text", "comment", "message", "positive", "liked"),
+    ),
+    "rating": (
+        ("rating", "score", "reviewscore", "averagescore", "scorevalue"),
+        ("rating", "score"),
+    ),
+    # Просто name/title не считается автором: так называются удобства, номера, достопримечательности
+    "author": (
+        ("author", "authorname", "guestname", "username", "reviewer", "reviewername", "displayname"),
+        ("author", "guest", "reviewer", "username"),
+    ),
+    "country": (
+        ("country", "guestcountry", "countryname", "countrycode", "nationality"),
+        ("country",),
+    ),
+    "date": (
+        ("date", "createdat", "reviewdate", "revieweddate", "publisheddate", "submittedat", "created"),
+        ("date", "created", "published", "submitted"),
+    ),
+    "room_type": (
+        ("roomtype", "room", "roomname"),
+        ("room",),
+    ),
+    "stay_duration": (
+        ("stayduration", "nights", "numnights", "numberofnights", "staylength"),
+        ("nights", "duration", "stay"),
+    ),
+}
+
+# Общие ключи, для которых поле определяется по имени родителя: guestDetails.name, roomType.name
+NAME_LIKE_KEYS = ("name", "value", "label", "title")
+
+# Вес полей при выборе лучшего массива
+FIELD_WEIGHTS = {"text": 3, "rating": 2, "author": 2, "date": 2, "country": 1, "room_type": 1, "stay_duration": 1}
+# Минимальная длина текста отзыва (как в DOM парсинге)
+MIN_TEXT_LENGTH = 10
+MAX_DEPTH = 8
+SAMPLE_SIZE = 5
+
+_path_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _normalize_key(key: str) -> str:
+    """Приводит ключ к виду для сравнения: reviewer_name, reviewerName -> reviewername"""
+    return re.sub(r'[^a-z0-9]', '', str(key).lower())
+
+
+def graphql_operation_name(post_data: Optional[str]) -> Optional[str]:
+    """Имя GraphQL операции из тела POST запроса (для пакетных запросов - имена через запятую)"""
+    if not post_data:
+        return None
+    try:
+        payload = json.loads(post_data)
+    except (TypeError, ValueError):
+        return None
+    operations = payload if isinstance(payload, list) else [payload]
+    names = [op.get("operationName") for op in operations if isinstance(op, dict) and op.get("operationName")]
+    return ','.join(names) or None
+
+
+def _cache_key(url: Optional[str], operation: Optional[str] = None) -> Optional[str]:
+    """
+    Ключ кеша: URL без query string и fragment плюс имя GraphQL операции
+
+    Все GraphQL операции идут на один URL, поэтому без имени операции
+    ответы разных запросов вытесняли бы путь к отзывам друг у друга.
+    """
+    if not url:
+        return None
+    parts = urlsplit(url)
+    if not operation:
+        operation = parse_qs(parts.query).get("operationName", [None])[0]
+    return f"{parts.netloc}{parts.path}#{operation or ''}"
+
+
+def _leaves(item: Dict, prefix: Tuple = (), depth: int = 3):
+    """Скалярные значения объекта вместе с путем к ним (до depth уровней вложенности)"""
+    for key, value in item.items():
+        path = prefix + (key,)
+        if isinstance(value, dict):
+            if depth > 1:
+                yield from _leaves(value, path, depth - 1)
+        elif isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def _value_fits(field: str, value) -> bool:
+    """Проверяет, подходит ли значение по типу для поля"""
+    if field == "rating":
+        if isinstance(value, (int, float)):
+            return True
+        return bool(re.fullmatch(r'\s*\d+(?:[.,]\d+)?\s*', value))
+    if field == "text":
+        return isinstance(value, str) and len(value.strip()) > MIN_TEXT_LENGTH
+    return value != ""
+
+
+def _leaf_field(path: Tuple, value) -> Optional[Tuple[int, str]]:
+    """
+    Поле отзыва для одного значения: (ранг совпадения, поле) или None
+
+    Подстроки ищутся в имени самого ключа; имя родителя учитывается только
+    для общих ключей из NAME_LIKE_KEYS, чтобы guestDetails.countryName
+    не стал автором. Одно значение заполняет не больше одного поля.
+    """
+    key = _normalize_key(path[-1])
+    context = _normalize_key(''.join(map(str, path[-2:]))) if key in NAME_LIKE_KEYS else key
+    best = None
+    for field, (exact, tokens) in FIELD_KEYS.items():
+        if key in exact:
+            rank = 2
+        elif any(token in context for token in tokens):
+            rank = 1
+        else:
+            continue
+        if _value_fits(field, value) and (best is None or rank > best[0]):
+            best = (rank, field)
+    return best
+
+
+def _match_fields(item: Dict) -> Dict[str, Tuple]:
+    """Сопоставляет поля отзыва путям внутри объекта"""
+    best = {}
+    for path, value in _leaves(item):
+        matched = _leaf_field(path, value)
+        if matched is None:
+            continue
+        rank, field = matched
+        # Точное совпадение важнее, при равенстве - более короткий путь
+        candidate = (rank, -len(path))
+        if field not in best or candidate > best[field][0]:
+            best[field] = (candidate, path)
+    return {field: path for field, (_, path) in best.items()}
+
+
+def _score_array(items: List) -> Tuple[int, Dict[str, Tuple]]:
+    """Оценивает, насколько массив похож на массив отзывов, и возвращает сопоставление полей"""
+    sample = [item for item in items[:SAMPLE_SIZE] if isinstance(item, dict)]
+    if not sample:
+        return 0, {}
+
+    votes = {}
+    for item in sample:
+        for field, path in _match_fields(item).items():
+            votes.setdefault(field, {})
+            votes[field][path] = votes[field].get(path, 0) + 1
+
+    mapping = {}
+    for field, paths in votes.items():
+        path, count = max(paths.items(), key=lambda pair: pair[1])
+        # Поле должно встречаться хотя бы в половине объектов выборки
+        if count * 2 >= len(sample):
+            mapping[field] = path
+
+    # Отзыв - это текст плюс рейтинг или автор с датой
+    if "text" not in mapping or not ("rating" in mapping or ("author" in mapping and "date" in mapping)):
+        return 0, {}
+    return sum(FIELD_WEIGHTS[field] for field in mapping), mapping
+
+
+def _find_review_arrays(data, path: Tuple = (), depth: int = 0):
+    """Обходит JSON и возвращает (score, path, mapping) для всех подходящих массивов"""
+    if depth > MAX_DEPTH:
+        return
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from _find_review_arrays(value, path + (key,), depth + 1)
+    elif isinstance(data, list) and data:
+        score, mapping = _score_array(data)
+        if score > 0:
+            yield score, path, mapping
+        for index, item in enumerate(data[:SAMPLE_SIZE]):
+            if isinstance(item, (dict, list)):
+                yield from _find_review_arrays(item, path + (index,), depth + 1)
+
+
+def _get_path(data, path: Tuple):
+    """Значение по пути (None если пути нет)"""
+    current = data
+    for key in path:
+        try:
+            current = current[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return current
+
+
+def discover_review_path(data) -> Optional[Tuple[int, Tuple, Dict[str, Tuple]]]:
+    """
+    Находит в JSON наиболее похожий на отзывы массив
+
+    Returns:
+        (оценка, путь к массиву, сопоставление полей) или None
+    """
+    best = None
+    for score, path, mapping in _find_review_arrays(data):
+        length = len(_get_path(data, path))
+        if best is None or (score, length) > best[0]:
+            best = ((score, length), path, mapping)
+    if best is None:
+        return None
+    return best[0][0], best[1], best[2]
+
+
+def _matches_mapping(items, mapping: Dict[str, Tuple]) -> bool:
+    """Быстрая проверка, что закешированный путь все еще указывает на отзывы"""
+    if not isinstance(items, list) or not items or not isinstance(items[0], dict):
+        return False
+    text = _get_path(items[0], mapping["text"])
+    return isinstance(text, str) and _value_fits("text", text)
+
+
+def map_review(item: Dict, mapping: Dict[str, Tuple]) -> Dict:
+    """Преобразует объект отзыва в формат парсера по сопоставлению полей"""
+    review = {}
+    for field in FIELD_KEYS:
+        path = mapping.get(field)
+        value = _get_path(item, path) if path else None
+        review[field] = value if value is not None else ("" if field != "rating" else None)
+    return review
+
+
+def _map_reviews(items: List, mapping: Dict[str, Tuple]) -> List[Dict]:
+    """Отзывы из массива: объекты без текста отзыва пропускаются"""
+    reviews = [map_review(item, mapping) for item in items if isinstance(item, dict)]
+    return [review for review in reviews if _value_fits("text", review["text"])]
+
+
+def extract_reviews(data, url: Optional[str] = None, operation: Optional[str] = None) -> List[Dict]:
+    """
+    Извлекает отзывы из JSON ответа
+
+    Сначала пробует путь, закешированный для endpoint и операции, и только если он
+    не подошел, обходит дерево целиком. Путь, который перестал подходить (например,
+    после смены формата API), заменяется новой находкой или удаляется из кеша.
+
+    Args:
+        data: Распарсенный JSON ответ
+        url: URL запроса, для которого кешируется найденный путь (опционально)
+        operation: Имя GraphQL операции запроса (опционально)
+
+    Returns:
+        Список отзывов в формате парсера
+    """
+    key = _cache_key(url, operation)
+    with _cache_lock:
+        cached = _path_cache.get(key) if key else None
+
+    if cached is not None:
+        path, mapping = cached
+        items = _get_path(data, path)
+        if _matches_mapping(items, mapping):
+            return _map_reviews(items, mapping)
+
+    discovered = discover_review_path(data)
+    if discovered is None:
+        if cached is not None:
+            with _cache_lock:
+                _path_cache.pop(key, None)
+        return []
+    _, path, mapping = discovered
+    logger.info(f"Discovered reviews at {'.'.join(map(str, path)) or '<root>'} with fields {sorted(mapping)}")
+    if key:
+        with _cache_lock:
+            _path_cache[key] = (path, mapping)
+
+    return _map_reviews(_get_path(data, path), mapping)
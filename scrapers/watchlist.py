@@ -0,0 +1,319 @@
+"""
+Watch list отелей с фоновым обновлением отзывов
+Для отелей из watch list API сразу отдает последний удачный результат
+(даже устаревший), а фоновый планировщик обновляет его через parse_booking_reviews.
+
+Записи хранятся в SQLite, поэтому все воркеры gunicorn видят один и тот же список.
+Планировщик работает только в одном процессе: его запускает процесс,
+захвативший файловую блокировку рядом с базой.
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from scrapers.booking_reviews import parse_booking_reviews
+
+try:
+    import fcntl
+except ImportError:  # Windows: один процесс, блокировка не нужна
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watchlist (
+    booking_url TEXT PRIMARY KEY,
+    hotel_id TEXT NOT NULL,
+    max_age REAL NOT NULL,
+    max_reviews INTEGER NOT NULL,
+    reviews TEXT,
+    fetched_at REAL,
+    last_error TEXT,
+    failures INTEGER NOT NULL DEFAULT 0,
+    refreshing INTEGER NOT NULL DEFAULT 0,
+    next_refresh_at REAL NOT NULL
+)
+"""
+
+
+class WatchEntry:
+    """Отель из watch list и его последний удачный результат"""
+
+    def __init__(self, booking_url: str, hotel_id: str, max_age: float, max_reviews: int = 10,
+                 reviews: Optional[List[Dict]] = None, fetched_at: Optional[float] = None,
+                 last_error: Optional[str] = None, failures: int = 0, refreshing: bool = False,
+                 next_refresh_at: Optional[float] = None):
+        self.booking_url = booking_url
+        self.hotel_id = hotel_id
+        self.max_age = max_age
+        self.max_reviews = max_reviews
+        self.reviews = reviews
+        self.fetched_at = fetched_at
+        self.last_error = last_error
+        self.failures = failures
+        self.refreshing = refreshing
+        self.next_refresh_at = time.time() if next_refresh_at is None else next_refresh_at
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> 'WatchEntry':
+        """Запись из строки таблицы watchlist"""
+        return cls(
+            booking_url=row["booking_url"],
+            hotel_id=row["hotel_id"],
+            max_age=row["max_age"],
+            max_reviews=row["max_reviews"],
+            reviews=json.loads(row["reviews"]) if row["reviews"] is not None else None,
+            fetched_at=row["fetched_at"],
+            last_error=row["last_error"],
+            failures=row["failures"],
+            refreshing=bool(row["refreshing"]),
+            next_refresh_at=row["next_refresh_at"],
+        )
+
+    def age(self) -> Optional[float]:
+        """Возраст последнего удачного результата в секундах"""
+        if self.fetched_at is None:
+            return None
+        return time.time() - self.fetched_at
+
+    def is_stale(self) -> bool:
+        """True если результата нет или он старше max_age"""
+        age = self.age()
+        return age is None or age > self.max_age
+
+    def to_dict(self) -> Dict:
+        """Состояние записи для API"""
+        age = self.age()
+        return {
+            "booking_url": self.booking_url,
+            "hotel_id": self.hotel_id,
+            "max_age_seconds": self.max_age,
+            "reviews_found": len(self.reviews) if self.reviews is not None else 0,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "staleness_seconds": round(max(age - self.max_age, 0), 1) if age is not None else None,
+            "stale": self.is_stale(),
+            "refreshing": self.refreshing,
+            "last_error": self.last_error,
+            "next_refresh_in_seconds": round(max(self.next_refresh_at - time.time(), 0), 1),
+        }
+
+
+class WatchList:
+    """
+    Watch list с фоновым планировщиком обновлений
+
+    Планировщик запускает не более concurrency обновлений одновременно и не чаще
+    одного запуска в min_interval секунд. Время следующего обновления берется
+    с разбросом (jitter), чтобы обновления отелей не собирались в пачки.
+    """
+
+    def __init__(self, db_path: str = 'watchlist.sqlite3', concurrency: int = 2, min_interval: float = 5.0,
+                 jitter: float = 0.1, retry_delay: float = 60.0, tick: float = 1.0, parser=None):
+        self.db_path = db_path
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.jitter = jitter
+        self.retry_delay = retry_delay
+        self.tick = tick
+        self.parser = parser or parse_booking_reviews
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._executor = None
+        self._thread = None
+        self._lock_file = None
+        self._last_start = 0.0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Соединение с базой в транзакции (соединения не разделяются между потоками)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def register(self, booking_url: str, hotel_id: str, max_age: float, max_reviews: int = 10) -> WatchEntry:
+        """Добавляет отель в watch list (или обновляет его параметры)"""
+        with self._connect() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM watchlist").fetchone()[0]
+            # Первое обновление разносится по времени, чтобы не было всплеска после регистрации
+            next_refresh_at = time.time() + random.uniform(0, self.min_interval * count)
+            conn.execute(
+                "INSERT INTO watchlist (booking_url, hotel_id, max_age, max_reviews, next_refresh_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(booking_url) DO UPDATE SET "
+                "hotel_id = excluded.hotel_id, max_age = excluded.max_age, max_reviews = excluded.max_reviews",
+                (booking_url, hotel_id, max_age, max_reviews, next_refresh_at)
+            )
+        logger.info(f"Watch list: registered {hotel_id} ({booking_url}), max_age={max_age}s")
+        self._wakeup.set()
+        return self.get(booking_url)
+
+    def unregister(self, booking_url: str) -> bool:
+        """Удаляет отель из watch list"""
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM watchlist WHERE booking_url = ?", (booking_url,)).rowcount
+        if removed:
+            logger.info(f"Watch list: unregistered {booking_url}")
+        return removed > 0
+
+    def get(self, booking_url: str) -> Optional[WatchEntry]:
+        """Запись watch list для URL (None если отель не отслеживается)"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM watchlist WHERE booking_url = ?", (booking_url,)).fetchone()
+        return WatchEntry.from_row(row) if row is not None else None
+
+    def entries(self) -> List[Dict]:
+        """Состояние всех записей watch list"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM watchlist ORDER BY booking_url").fetchall()
+        return [WatchEntry.from_row(row).to_dict() for row in rows]
+
+    def request_refresh(self, booking_url: str):
+        """
+        Просит планировщик обновить запись как можно скорее
+
+        Записи после неудачных обновлений ждут окончания backoff, иначе
+        каждое обращение к устаревшему результату отменяло бы его.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE watchlist SET next_refresh_at = MIN(next_refresh_at, ?) "
+                "WHERE booking_url = ? AND refreshing = 0 AND failures = 0",
+                (time.time(), booking_url)
+            )
+        self._wakeup.set()
+
+    def store_result(self, booking_url: str, reviews: List[Dict]):
+        """Сохраняет результат живого парсинга для отеля, у которого еще нет результата"""
+        if not reviews:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE watchlist SET reviews = ?, fetched_at = ?, last_error = NULL, failures = 0, "
+                "next_refresh_at = ? + max_age * ? "
+                "WHERE booking_url = ? AND reviews IS NULL",
+                (json.dumps(reviews), now, now, random.uniform(1 - self.jitter, 1), booking_url)
+            )
+
+    def start(self):
+        """
+        Запускает поток, который захватывает роль планировщика
+
+        Планировщик работает в том процессе, которому удалось захватить блокировку;
+        остальные процессы периодически пытаются ее захватить (на случай, если
+        процесс-планировщик завершится).
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='watchlist-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает планировщик и освобождает блокировку"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _acquire_leadership(self) -> bool:
+        """Пытается захватить блокировку планировщика (без ожидания)"""
+        if fcntl is None:
+            return True
+        lock_file = open(self.db_path + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _run(self):
+        """Цикл планировщика"""
+        while not self._acquire_leadership():
+            if self._stopped.wait(self.tick * 10):
+                return
+
+        # Обновления, прерванные падением прежнего планировщика, запускаются заново
+        with self._connect() as conn:
+            conn.execute("UPDATE watchlist SET refreshing = 0")
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='watchlist-refresh')
+        logger.info(f"Watch list scheduler started: concurrency={self.concurrency}, min_interval={self.min_interval}s")
+
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.tick)
+            self._wakeup.clear()
+            try:
+                self._schedule_due()
+            except Exception as e:
+                logger.error(f"Watch list scheduler error: {e}", exc_info=True)
+
+    def _schedule_due(self):
+        """Запускает обновления записей, у которых подошло время"""
+        now = time.time()
+        if now - self._last_start < self.min_interval:
+            return
+        with self._connect() as conn:
+            in_flight = conn.execute("SELECT COUNT(*) FROM watchlist WHERE refreshing = 1").fetchone()[0]
+            if in_flight >= self.concurrency:
+                return
+            row = conn.execute(
+                "SELECT * FROM watchlist WHERE refreshing = 0 AND next_refresh_at <= ? "
+                "ORDER BY next_refresh_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return
+            conn.execute("UPDATE watchlist SET refreshing = 1 WHERE booking_url = ?", (row["booking_url"],))
+        self._last_start = now
+        self._executor.submit(self._refresh, WatchEntry.from_row(row))
+
+    def _refresh(self, entry: WatchEntry):
+        """Обновляет отзывы одной записи, сохраняя последний удачный результат"""
+        logger.info(f"Watch list: refreshing {entry.hotel_id} ({entry.booking_url})")
+        try:
+            reviews = self.parser(entry.booking_url, max_reviews=entry.max_reviews)
+            error = None if reviews else "No reviews parsed"
+        except Exception as e:
+            reviews = None
+            error = str(e)
+
+        now = time.time()
+        with self._connect() as conn:
+            if error is None:
+                delay = entry.max_age * random.uniform(1 - self.jitter, 1)
+                conn.execute(
+                    "UPDATE watchlist SET reviews = ?, fetched_at = ?, last_error = NULL, failures = 0, "
+                    "refreshing = 0, next_refresh_at = ? WHERE booking_url = ?",
+                    (json.dumps(reviews), now, now + delay, entry.booking_url)
+                )
+            else:
+                failures = entry.failures + 1
+                delay = min(self.retry_delay * 2 ** (failures - 1), entry.max_age)
+                logger.warning(f"Watch list: refresh failed for {entry.hotel_id}: {error}")
+                conn.execute(
+                    "UPDATE watchlist SET last_error = ?, failures = ?, refreshing = 0, next_refresh_at = ? "
+                    "WHERE booking_url = ?",
+                    (error, failures, now + delay, entry.booking_url)
+                )
+        self._wakeup.set()
@@ -0,0 +1,126 @@
+"""
+Тесты дедлайнов parse_booking_reviews_with_status на фейковом драйвере
+"""
+import json
+import time
+
+import pytest
+
+from selenium.common.exceptions import WebDriverException
+
+from scrapers import booking_reviews
+from scrapers.deadline import Deadline, StageBudget
+
+
+GRAPHQL_URL = 'https://www.booking.com/dml/graphql'
+GRAPHQL_BODY = json.dumps({
+    "data": {"reviews": [
+        {"text": "Great hotel, very clean rooms", "rating": 9, "author": "Ann", "date": "2024-01-01"},
+        {"text": "Good location, friendly staff", "rating": 8, "author": "Bob", "date": "2024-01-02"},
+    ]}
+})
+
+
+class FakeDriver:
+    """Драйвер без браузера: в performance логе уже есть JSON ответ с отзывами"""
+
+    def __init__(self, review_elements=10):
+        self.review_elements = review_elements
+
+    def execute_cdp_cmd(self, cmd, params):
+        if cmd == 'Network.getResponseBody':
+            return {'body': GRAPHQL_BODY}
+        return {}
+
+    def get_log(self, log_type):
+        message = {"message": {
+            "method": "Network.responseReceived",
+            "params": {"requestId": "1", "response": {"url": GRAPHQL_URL, "status": 200, "mimeType": "application/json"}},
+        }}
+        return [{"message": json.dumps(message)}]
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    def get(self, url):
+        pass
+
+    def execute_script(self, script, *args):
+        return list(args[0]) if args else None
+
+    def find_element(self, by, selector):
+        raise Exception("not found")
+
+    def find_elements(self, by, selector):
+        return [object()] * self.review_elements
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def fake_driver(monkeypatch):
+    driver = FakeDriver()
+    monkeypatch.setattr(booking_reviews, '_setup_driver', lambda: driver)
+    return driver
+
+
+def test_pad_is_trimmed_without_cutting_stage():
+    budget = StageBudget('navigation', 0.2)
+    started = time.monotonic()
+    budget.pad(5)
+    assert time.monotonic() - started < 0.2
+    assert budget.trimmed
+    assert not budget.cut
+    assert not budget.expired()
+
+
+def test_stage_shares_leave_budget_for_later_stages():
+    deadline = Deadline(1000)
+    # Без драйвера работы нет: он может занять все, кроме резерва последующих этапов
+    driver_budget = deadline.stage('driver')
+    assert driver_budget.remaining() == pytest.approx(0.7, abs=0.02)
+    navigation_budget = deadline.stage('navigation')
+    # Драйвер не потратил свою долю: навигация получает 3/8 оставшейся секунды
+    assert navigation_budget.remaining() == pytest.approx(0.375, abs=0.02)
+
+
+def test_page_load_timeout_survives_failing_window_stop(fake_driver, monkeypatch):
+    def get(url):
+        raise booking_reviews.TimeoutException("page load timeout")
+
+    def execute_script(script, *args):
+        if script == "window.stop();":
+            raise WebDriverException("no such window")
+        return list(args[0]) if args else None
+
+    monkeypatch.setattr(fake_driver, 'get', get)
+    monkeypatch.setattr(fake_driver, 'execute_script', execute_script)
+    result = booking_reviews.parse_booking_reviews_with_status('https://www.booking.com/hotel/x.html', deadline_ms=1000)
+    assert len(result["reviews"]) == 2
+    assert result["stage"] == "navigation"
+
+
+def test_no_deadline_returns_network_reviews(fake_driver, monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+    result = booking_reviews.parse_booking_reviews_with_status('https://www.booking.com/hotel/x.html')
+    assert len(result["reviews"]) == 2
+    assert result["partial"] is False
+    assert result["stage"] is None
+
+
+def test_deadline_keeps_time_for_network_scan(fake_driver):
+    started = time.monotonic()
+    result = booking_reviews.parse_booking_reviews_with_status('https://www.booking.com/hotel/x.html', deadline_ms=2000)
+    assert time.monotonic() - started < 2.0
+    assert len(result["reviews"]) == 2
+    assert result["partial"] is False
+    assert result["stage"] is None
+
+
+def test_scrolling_marked_partial_when_reviews_not_loaded(fake_driver):
+    fake_driver.review_elements = 0
+    result = booking_reviews.parse_booking_reviews_with_status('https://www.booking.com/hotel/x.html', deadline_ms=1000)
+    assert len(result["reviews"]) == 2
+    assert result["partial"] is True
+    assert result["stage"] == "scrolling"
@@ -0,0 +1,139 @@
+"""
+Тесты схлопывания кандидатов отзывов (_RESOLVE_CANDIDATES_SCRIPT)
+Скрипт выполняется в node на минимальной модели DOM.
+"""
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from scrapers.booking_reviews import _RESOLVE_CANDIDATES_SCRIPT
+
+pytestmark = pytest.mark.skipif(shutil.which('node') is None, reason="node is not installed")
+
+# Минимальная модель DOM: contains, compareDocumentPosition, innerText и querySelector
+# для селекторов вида [attr*='value'] и tag
+DOM_SHIM = """
+var Node = {DOCUMENT_POSITION_FOLLOWING: 4};
+var order = 0;
+function build(spec, parent) {
+    var node = {
+        id: spec.id, tagName: (spec.tag || 'div').toUpperCase(), className: spec['class'] || '',
+        attrs: spec.attrs || {}, ownText: spec.text || '', parent: parent, order: order++
+    };
+    node.children = (spec.children || []).map(function(child) { return build(child, node); });
+    node.innerText = node.ownText + ' ' + node.children.map(function(c) { return c.innerText; }).join(' ');
+    node.contains = function(other) {
+        for (var cur = other; cur; cur = cur.parent) if (cur === node) return true;
+        return false;
+    };
+    node.compareDocumentPosition = function(other) { return other.order > node.order ? 4 : 2; };
+    node.querySelector = function(selectors) {
+        var parts = selectors.split(',');
+        var found = null;
+        (function walk(cur) {
+            cur.children.forEach(function(child) {
+                if (found) return;
+                parts.forEach(function(part) {
+                    var m = part.match(/^\\[([\\w-]+)\\*='([^']+)'\\]$/);
+                    var value = m ? (m[1] === 'class' ? child.className : child.attrs[m[1]] || '') : null;
+                    if (m ? value.indexOf(m[2]) >= 0 : child.tagName === part.toUpperCase()) found = child;
+                });
+                if (!found) walk(child);
+            });
+        })(node);
+        return found;
+    };
+    return node;
+}
+var input = JSON.parse(process.argv[process.argv.length - 1]);
+var root = build(input.dom, null);
+var all = [];
+(function walk(node) { all.push(node); node.children.forEach(walk); })(root);
+var candidates = all.filter(function(node) { return node.className.indexOf('review') >= 0; }).reverse();
+var result = (function() { %s }).apply(null, [candidates]);
+console.log(JSON.stringify(result === null ? null : result.map(function(node) { return node.id; })));
+"""
+
+
+def _resolve(dom):
+    script = DOM_SHIM % _RESOLVE_CANDIDATES_SCRIPT
+    output = subprocess.check_output(['node', '-e', script, json.dumps({"dom": dom})], text=True)
+    return json.loads(output)
+
+
+def _card(idx, rows=2):
+    """Карточка отзыва c-review с одинаковыми строками liked/disliked"""
+    return {
+        "id": f"card{idx}", "class": "c-review",
+        "children": [
+            {"class": "c-review__header", "children": [
+                {"tag": "span", "class": "bui-avatar-block__title name", "text": f"Guest {idx}"},
+                {"tag": "span", "class": "review-score-badge", "text": "9.0"},
+            ]},
+        ] + [
+            {"id": f"card{idx}-row{row}", "class": "c-review__row",
+             "text": f"Row {row} of review {idx} with enough text"}
+            for row in range(rows)
+        ],
+    }
+
+
+def test_identical_rows_stay_inside_their_review():
+    dom = {"id": "list", "class": "review_list", "children": [_card(idx) for idx in range(3)]}
+    assert _resolve(dom) == ["card0", "card1", "card2"]
+
+
+def test_single_review_in_list_resolves_to_card():
+    dom = {"id": "list", "class": "review_list", "children": [_card(0)]}
+    assert _resolve(dom) == ["card0"]
+
+
+def test_section_with_score_widget_expands_to_cards():
+    dom = {"id": "section", "class": "reviews-section", "children": [
+        {"id": "score", "class": "review-score-widget", "text": "Scored 8.7 Very good", "children": [
+            {"tag": "span", "class": "review-score-badge", "text": "8.7"},
+        ]},
+        {"id": "list", "class": "review_list", "children": [_card(idx) for idx in range(3)]},
+    ]}
+    assert _resolve(dom) == ["card0", "card1", "card2"]
+
+
+def test_list_of_different_review_kinds_expands():
+    featured = _card(1)
+    featured["class"] = "c-review c-review--featured"
+    dom = {"id": "list", "class": "review_list", "children": [_card(0), featured]}
+    assert _resolve(dom) == ["card0", "card1"]
+
+
+def test_score_without_author_or_date_is_not_review():
+    dom = {"id": "list", "class": "review_list", "children": [
+        {"id": "score", "class": "review-score-widget", "text": "Scored 8.7 Very good", "children": [
+            {"tag": "span", "class": "review-score-badge", "text": "8.7"},
+        ]},
+        {"id": "hotel", "class": "review-hotel", "text": "Grand Hotel Dubai Marina", "children": [
+            {"tag": "h2", "class": "hotel-name", "text": "Grand Hotel"},
+        ]},
+    ]}
+    assert _resolve(dom) is None
+
+
+def test_wrapper_with_distinct_blocks_is_one_review():
+    dom = {"id": "card", "class": "review-card", "children": [
+        {"id": "header", "class": "review-header", "children": [
+            {"tag": "span", "class": "reviewer-name", "text": "Guest with a long name"},
+        ]},
+        {"id": "body", "class": "review-body", "text": "Great stay, clean rooms", "children": [
+            {"tag": "span", "class": "review-score", "text": "9.0"},
+        ]},
+    ]}
+    assert _resolve(dom) == ["card"]
+
+
+def test_without_review_fields_candidates_are_kept():
+    dom = {"id": "list", "class": "review_list", "children": [
+        {"id": "a", "class": "review-item", "text": "First review text here"},
+        {"id": "b", "class": "review-item", "text": "Second review text here"},
+    ]}
+    assert _resolve(dom) is None
@@ -0,0 +1,146 @@
+"""
+Тесты поиска отзывов в JSON ответах (scrapers.review_discovery)
+"""
+import json
+
+import pytest
+
+from scrapers import review_discovery
+from scrapers.review_discovery import extract_reviews, graphql_operation_name
+
+GRAPHQL_URL = 'https://www.booking.com/dml/graphql?lang=en-us'
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    review_discovery._path_cache.clear()
+    yield
+    review_discovery._path_cache.clear()
+
+
+def _review_card(idx):
+    return {
+        "reviewScore": 9 - idx,
+        "guestDetails": {"username": f"Guest {idx}", "countryName": "France"},
+        "textDetails": {"positiveText": f"Great stay number {idx}, clean rooms", "title": "Nice"},
+        "reviewedDate": 1700000000 + idx,
+        "bookingDetails": {"roomType": {"name": "Double Room"}, "numNights": 2},
+    }
+
+
+REVIEWS_RESPONSE = {"data": {"reviewListFrontend": {"reviewCard": [_review_card(idx) for idx in range(3)]}}}
+
+FACILITIES_RESPONSE = {"data": {"hotel": {"reviewScore": 8.7, "facilities": [
+    {"name": "Free WiFi", "iconText": "wifi"},
+    {"name": "Swimming pool", "iconText": "pool"},
+    {"name": "Parking", "iconText": "parking"},
+]}}}
+
+LANDMARKS_RESPONSE = {"data": {"hotel": {"reviewScore": 8.7, "landmarks": [
+    {"name": "Dubai Mall", "title": "Shopping centre", "text": "Largest shopping mall nearby", "distance": "2 km"},
+    {"name": "Burj Khalifa", "title": "Landmark", "text": "Tallest building in the world", "distance": "2.5 km"},
+]}}}
+
+ROOMS_RESPONSE = {"data": {"hotel": {"rating": 8.7, "rooms": [
+    {"roomName": "Double Room", "description": "Spacious room with a city view", "createdAt": "2024-01-01"},
+    {"roomName": "Twin Room", "description": "Two single beds and a work desk", "createdAt": "2024-01-01"},
+]}}}
+
+
+def test_discovers_nested_review_fields():
+    reviews = extract_reviews(REVIEWS_RESPONSE, GRAPHQL_URL)
+    assert len(reviews) == 3
+    assert reviews[0] == {
+        "text": "Great stay number 0, clean rooms",
+        "rating": 9,
+        "author": "Guest 0",
+        "country": "France",
+        "date": 1700000000,
+        "room_type": "Double Room",
+        "stay_duration": 2,
+    }
+
+
+def test_flat_legacy_shape():
+    data = {"data": {"hotel": {"reviews": [
+        {"comment": "Nice place, would come back", "score": "8.5", "guest_name": "Q", "created_at": "2024"},
+    ]}}}
+    reviews = extract_reviews(data)
+    assert reviews[0]["text"] == "Nice place, would come back"
+    assert reviews[0]["rating"] == "8.5"
+    assert reviews[0]["author"] == "Q"
+
+
+@pytest.mark.parametrize("data", [FACILITIES_RESPONSE, LANDMARKS_RESPONSE, ROOMS_RESPONSE],
+                         ids=["facilities", "landmarks", "rooms"])
+def test_non_review_arrays_are_rejected(data):
+    assert extract_reviews(data, GRAPHQL_URL) == []
+
+
+def test_short_texts_are_not_reviews():
+    data = {"items": [{"text": "ok", "rating": 9}, {"text": "fine", "rating": 8}]}
+    assert extract_reviews(data) == []
+
+
+def test_author_with_date_without_rating_is_review():
+    data = {"items": [{"text": "Lovely staff and breakfast", "author": "Ann", "date": "2024-01-01"}]}
+    assert extract_reviews(data)[0]["author"] == "Ann"
+
+
+def test_operation_name_from_post_data():
+    assert graphql_operation_name(json.dumps({"operationName": "ReviewList", "query": "..."})) == "ReviewList"
+    assert graphql_operation_name(json.dumps([{"operationName": "A"}, {"operationName": "B"}])) == "A,B"
+    assert graphql_operation_name("not json") is None
+    assert graphql_operation_name(None) is None
+
+
+def test_cache_is_keyed_by_operation(monkeypatch):
+    extract_reviews(REVIEWS_RESPONSE, GRAPHQL_URL, "ReviewList")
+    extract_reviews(FACILITIES_RESPONSE, GRAPHQL_URL, "PropertyFacilities")
+    assert len(review_discovery._path_cache) == 1
+
+    # Повторный ответ той же операции разбирается по закешированному пути, без обхода дерева
+    monkeypatch.setattr(review_discovery, 'discover_review_path', lambda data: pytest.fail("tree walk"))
+    assert len(extract_reviews(REVIEWS_RESPONSE, GRAPHQL_URL, "ReviewList")) == 3
+
+
+def test_changed_api_shape_replaces_cached_path(monkeypatch):
+    extract_reviews(REVIEWS_RESPONSE, GRAPHQL_URL, "ReviewList")
+
+    changed = {"data": {"reviews": {"items": [
+        {"comment": f"Review in the new API shape {idx}", "score": 8, "author": "Ann"} for idx in range(3)
+    ]}}}
+    assert len(extract_reviews(changed, GRAPHQL_URL, "ReviewList")) == 3
+    assert review_discovery._path_cache[review_discovery._cache_key(GRAPHQL_URL, "ReviewList")][0] == \
+        ("data", "reviews", "items")
+
+    # Новый путь используется напрямую, без обхода дерева
+    monkeypatch.setattr(review_discovery, 'discover_review_path', lambda data: pytest.fail("tree walk"))
+    assert len(extract_reviews(changed, GRAPHQL_URL, "ReviewList")) == 3
+
+
+def test_dead_cached_path_is_dropped():
+    extract_reviews(REVIEWS_RESPONSE, GRAPHQL_URL, "ReviewList")
+    assert extract_reviews(FACILITIES_RESPONSE, GRAPHQL_URL, "ReviewList") == []
+    assert review_discovery._path_cache == {}
+
+
+def test_parent_context_does_not_fill_two_fields():
+    data = {"items": [
+        {"guestDetails": {"countryName": "France", "name": "Ann"}, "rating": 9,
+         "text": "Lovely staff and breakfast"},
+    ]}
+    review = extract_reviews(data)[0]
+    assert review["author"] == "Ann"
+    assert review["country"] == "France"
+
+
+def test_items_without_text_are_skipped():
+    data = {"items": [
+        {"text": "Lovely staff and breakfast", "rating": 9},
+        {"rating": 3},
+        {"text": "Quiet room, good view of the marina", "rating": 8},
+    ]}
+    assert [review["rating"] for review in extract_reviews(data, GRAPHQL_URL)] == [9, 8]
+    # Тот же результат при разборе по закешированному пути
+    assert [review["rating"] for review in extract_reviews(data, GRAPHQL_URL)] == [9, 8]
@@ -0,0 +1,86 @@
+"""
+Тесты watch list: общее хранилище и единственный планировщик
+"""
+import time
+
+from scrapers.watchlist import WatchList
+
+URL = 'https://www.booking.com/hotel/ae/watched.html'
+
+
+def _reviews(url, max_reviews=10):
+    return [{"text": f"Review for {url}", "rating": 9.0}]
+
+
+def _wait_for(predicate, timeout=5.0):
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_entries_are_shared_between_instances(tmp_path):
+    db_path = str(tmp_path / 'watchlist.sqlite3')
+    first = WatchList(db_path=db_path, parser=_reviews)
+    second = WatchList(db_path=db_path, parser=_reviews)
+
+    first.register(URL, 'hotel-1', max_age=60)
+    assert second.get(URL).hotel_id == 'hotel-1'
+    assert [entry["booking_url"] for entry in second.entries()] == [URL]
+
+    assert second.unregister(URL)
+    assert first.get(URL) is None
+
+
+def test_store_result_fills_only_missing_result(tmp_path):
+    watchlist = WatchList(db_path=str(tmp_path / 'watchlist.sqlite3'), parser=_reviews)
+    watchlist.register(URL, 'hotel-1', max_age=60)
+
+    watchlist.store_result(URL, [{"text": "live scrape"}])
+    entry = watchlist.get(URL)
+    assert entry.reviews == [{"text": "live scrape"}]
+    assert not entry.is_stale()
+
+    watchlist.store_result(URL, [{"text": "second live scrape"}])
+    assert watchlist.get(URL).reviews == [{"text": "live scrape"}]
+
+
+def test_only_one_scheduler_refreshes(tmp_path):
+    db_path = str(tmp_path / 'watchlist.sqlite3')
+    calls = []
+
+    def parser(url, max_reviews=10):
+        calls.append(url)
+        return _reviews(url)
+
+    leader = WatchList(db_path=db_path, min_interval=0, tick=0.05, parser=parser)
+    follower = WatchList(db_path=db_path, min_interval=0, tick=0.05, parser=parser)
+    leader.start()
+    assert _wait_for(lambda: leader._executor is not None)
+    follower.start()
+
+    try:
+        follower.register(URL, 'hotel-1', max_age=60)
+        assert _wait_for(lambda: follower.get(URL).reviews is not None)
+        time.sleep(0.3)
+        assert calls == [URL]
+        assert follower._executor is None
+    finally:
+        leader.stop()
+        follower.stop()
+
+
+def test_request_refresh_keeps_failure_backoff(tmp_path):
+    def failing(url, max_reviews=10):
+        raise RuntimeError("blocked")
+
+    watchlist = WatchList(db_path=str(tmp_path / 'watchlist.sqlite3'), retry_delay=60, parser=failing)
+    entry = watchlist.register(URL, 'hotel-1', max_age=3600)
+    watchlist._refresh(entry)
+    backoff_until = watchlist.get(URL).next_refresh_at
+    assert backoff_until > time.time() + 50
+
+    watchlist.request_refresh(URL)
+    assert watchlist.get(URL).next_refresh_at == backoff_until